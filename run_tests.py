@@ -56,20 +56,47 @@ Usage:
 """
 
 
-import inspect
+import functools
 import traceback
 import io 
+import os
 import sys
-import pathlib
+import types
 from typing import Any
 
 import pytest
 
 __all__ = ['run_tests']
 
+class _ListSink(io.TextIOBase):
+    """Minimal write-only text stream that accumulates writes in a list.
+
+    Stands in for io.StringIO as the redirect target. Appending to a list
+    avoids StringIO's buffer reallocation as captured output grows; the
+    parts are only joined once, when the stream is read. Subclassing
+    io.TextIOBase gives tests the rest of the file API they may expect
+    on sys.stdout (isatty, closed, encoding, ...).
+    """
+
+    def __init__(self):
+        self.buf = []
+
+    def write(self, s):
+        if not isinstance(s, str):
+            raise TypeError(f'string argument expected, got {type(s).__name__!r}')
+        self.buf.append(s)
+        return len(s)
+
+    def getvalue(self):
+        return ''.join(self.buf)
+
+    def writable(self):
+        return True
+
+
 class SwitchStdout:
     orig = sys.stdout
-    redir = io.StringIO()
+    redir = _ListSink()
     saved_streams = {}
     is_switched = False
 
@@ -112,15 +139,16 @@ class SwitchStdout:
               You can only choose one. If in doubt, save the stream. You can always
               read or print it later.  
         """
-        return_val = None
+        orig = cls.orig
 
         if cls.is_switched:
             # TODO: create validation and Exceptions for these assertions
-            assert isinstance(cls.orig, io.TextIOWrapper)
-            assert isinstance(sys.stdout, io.StringIO)
-            assert cls.redir == sys.stdout
-            assert 1 >= sum([print_stream, read_stream, (save_stream_as != None)])
-            sys.stdout = cls.orig 
+            if __debug__ and _VALIDATE:
+                assert isinstance(orig, io.TextIOWrapper)
+                assert isinstance(sys.stdout, _ListSink)
+                assert cls.redir == sys.stdout
+                assert 1 >= sum([print_stream, read_stream, (save_stream_as != None)])
+            sys.stdout = orig 
             cls.is_switched = False
             if save_stream_as:
                 cls.save_stream(save_stream_as)            
@@ -131,22 +159,25 @@ class SwitchStdout:
                 # sys.stdout when saved stream is None
                 return cls.read_stream()
             elif flush_stream:
-                cls._flush_stream()
+                # discard without joining the captured output
+                cls._renew_stream()
 
         else:
-            assert isinstance(cls.orig, io.TextIOWrapper)
-            assert (cls.orig == sys.stdout)
-            sys.stdout = cls.redir
+            if __debug__ and _VALIDATE:
+                assert isinstance(orig, io.TextIOWrapper)
+                assert (orig == sys.stdout)
+            sys.stdout = redir = cls.redir
             cls.is_switched = True
+            return redir
 
-        return sys.stdout
+        return orig
 
     @classmethod 
     def save_stream(cls, name):
         """Saves the current redirected stream and creates a new one.
         """
         cls.saved_streams[name] = cls.redir
-        cls._renew_stream()
+        cls._renew_stream(reuse=False)
 
     @classmethod 
     def print_stream(cls, stream_name: str = None):
@@ -165,13 +196,12 @@ class SwitchStdout:
         """Returns the contents of stream and flushes it.
         """
         if stream_name:
-            stream = cls.saved_streams.pop(stream_name)
-        else:
-            stream = cls.redir 
-            cls._renew_stream()
+            return cls.saved_streams.pop(stream_name).getvalue()
 
-        content = stream.getvalue()
-        return stream.getvalue()
+        # read before renewing, the current stream is cleared for reuse
+        content = cls.redir.getvalue()
+        cls._renew_stream()
+        return content
 
         # stream = (cls.saved_streams.pop(stream_name)
         #           or cls.redir)
@@ -180,14 +210,26 @@ class SwitchStdout:
         # return output
 
     @classmethod 
-    def _renew_stream(cls):
+    def _renew_stream(cls, reuse: bool = True):
         """Start a fresh redirect stream.
+
+        By default the current stream is emptied and reused. Pass
+        reuse=False when the current stream must be kept intact, eg
+        because it has been saved. A stream a test has closed is never
+        reused.
         """
-        cls.redir = io.StringIO()
+        if reuse and not cls.redir.closed:
+            cls.redir.buf.clear()
+            return
+        cls.redir = _ListSink()
         if cls.is_switched:
-            assert isinstance(cls.orig, io.TextIOWrapper)
             sys.stdout = cls.redir        
 
+# orig is set once at import, so check it once here.
+# Set _VALIDATE to re-check the stream state on every switch.
+assert isinstance(SwitchStdout.orig, io.TextIOBase)
+_VALIDATE = False
+
 switch_stdout = SwitchStdout.switch_stdout
 save_stream = SwitchStdout.save_stream
 print_stream = SwitchStdout.print_stream
@@ -206,23 +248,52 @@ class bcolors:
     UNDERLINE = '\033[4m'
 c = bcolors
 
+# Escape codes are just noise when output is piped or redirected
+if not sys.stdout.isatty():
+    for color in ('HEADER', 'OKBLUE', 'OKCYAN', 'GREEN', 'WARNING',
+                  'RED', 'END', 'BOLD', 'UNDERLINE'):
+        setattr(bcolors, color, '')
+
+_GREEN, _RED, _END = bcolors.GREEN, bcolors.RED, bcolors.END
+_SUCCESS_TAIL = f'...{_GREEN}success{_END}'
+_FAIL_TAIL = f'......{_RED}FAIL{_END}'
+_FAILED_TEST_HEAD = f'\n{_RED}FAILED TEST{_END}: '
+
 
-def format_test_result(test, max_text_len,success=True):
+def format_test_result(test, max_text_len, dots_pool, success=True):
     num_dots = max_text_len - len(test)
-    dots = '.' * num_dots if num_dots > 1 else '' 
-    if success:
-        return f'{dots}...{c.GREEN}success{c.END}'
-    else:
-        return f'{dots}......{c.RED}FAIL{c.END}'
+    dots = dots_pool[:num_dots] if num_dots > 1 else '' 
+    return dots + (_SUCCESS_TAIL if success else _FAIL_TAIL)
 
     
-def format_failed_test_printout(test, exc, captured_stdout, locals=None):
-    tb = traceback.format_exception(type(exc), exc, exc.__traceback__)[2:]
+def snapshot_failure(exc):
+    """Records exc's traceback, from the test's frame on, for formatting later.
+
+    The snapshot holds no frames and leaves exc untouched, so it stays correct
+    even if the same exception object is raised again by a later test. Source
+    lines are only looked up when the snapshot is formatted.
+    """
+    # skip the runner's own frame, which called the test
+    return traceback.TracebackException(
+        type(exc), exc, exc.__traceback__.tb_next, lookup_lines=False
+    )
+
+
+def format_failed_test_printout(test, tb_exc, captured_stdout, locals=None):
+    tb_lines = list(tb_exc.format())
+    # drop the test's own "Traceback (most recent call last):" header. Any
+    # chained causes come first and keep theirs; the test's exception is last.
+    if tb_exc.stack:
+        del tb_lines[-sum(1 for _ in tb_exc.format(chain=False))]
 
-    failed_test = (f"\n{c.RED}FAILED TEST{c.END}: {test}\n{''.join(tb)}")
+    parts = [_FAILED_TEST_HEAD, test, '\n']
+    parts.extend(tb_lines)
     if captured_stdout:
-        failed_test += f"  Captured stdout calls:\n{captured_stdout}"
-    if failed_test.endswith('\n'): failed_test = failed_test[:-1]
+        parts.append("  Captured stdout calls:\n")
+        parts.append(captured_stdout)
+    # trim the trailing newline off the last piece rather than the whole report
+    if parts[-1].endswith('\n'): parts[-1] = parts[-1][:-1]
+    failed_test = ''.join(parts)
 
     # frame_info = inspect.getframeinfo(e.__traceback__.tb_next)._asdict()
     # exc_info = f"{e.__class__.__name__}: {str(e)}" # can also use e.__repr__()
@@ -234,26 +305,18 @@ def format_failed_test_printout(test, exc, captured_stdout, locals=None):
 
 
 def get_local_variables():
-    """Adds local variables to the log record if an exception was raised.
-
-    The record's `exc_info` attribute is used as the indicator that an exception
-    was encountered. If any variable is of type `PrefectFuture`, it is replaced
-    with its underlying value.
-
-    Args:
-        record: the logging object that has been passed to a logger.
+    """Returns the local variables where the exception being handled was raised.
 
     Returns:
-        A copy of `record`, unchanged if there was no exception, 
-          or with an added attribute `variables` containing a dict
-          of the local variables and their values in the scope where
-          the record was created. 
+        The innermost frame's f_locals dict, or None if no exception is 
+          being handled.
     """
-    locals: dict = None
-    try:
-        locals = inspect.trace()[-1][0].f_locals
-    except:
-        _=''
+    tb = sys.exc_info()[2]
+    if tb is None:
+        return None
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    locals: dict = tb.tb_frame.f_locals
     return locals
 
 
@@ -265,14 +328,23 @@ class TestResults:
         self.failed_tests: list = []
 
     def print_test_summary(self):
-        success = str(self.testcount - self.failcount).rjust(5)
-        fail = str(self.failcount).rjust(5)
-        print('\n', end='')
-        print(f'Testing complete. Out of {self.testcount} tests:')
-        print(f'{c.GREEN}{success}{c.END} succeeded')
-        print(f'{c.RED}{fail}{c.END} failed')
-        for test in self.failed_tests:
-            print(test)
+        sys.stdout.write(
+            f'\nTesting complete. Out of {self.testcount} tests:\n'
+            f'{_GREEN}{self.testcount - self.failcount:>5}{_END} succeeded\n'
+            f'{_RED}{self.failcount:>5}{_END} failed\n'
+        )
+        self.print_failed_tests()
+
+    def print_failed_tests(self):
+        """Writes all the failure reports in one call.
+        """
+        sys.stdout.write(''.join(f'{test}\n' for test in self.format_failed_tests()))
+
+    def format_failed_tests(self):
+        """Yields the failure report for each failed test.
+        """
+        for test, tb_exc, captured_stdout in self.failed_tests:
+            yield format_failed_test_printout(test, tb_exc, captured_stdout)
 
 
 
@@ -302,63 +374,127 @@ def run_tests(raise_on_err: bool=False, *tests_to_run: str):
             (coming soon: Setup and teardown are still run.)
     """
     mod = sys.modules['__main__']
-    mod_name = pathlib.Path(mod.__file__).stem
-    mod_dir = dir(mod)
+    mod_name = os.path.splitext(os.path.basename(mod.__file__))[0]
     results = TestResults()
+    # pytest may already be capturing stdout. The env var alone isn't enough,
+    # subprocesses of a pytest test inherit it without being captured.
+    capture = not ('PYTEST_CURRENT_TEST' in os.environ
+                   and type(sys.stdout).__module__ == '_pytest.capture')
+    module_tests, test_classes = _discover_tests(mod)
 
     # Run module-level test functions
-    run_tests_in(mod_name, mod, results, tests_to_run, raise_on_err)
-
-    # Gather and run test methods within test classes
-    test_classes = [
-        attr for attr in mod_dir \
-        if attr.startswith('Test') \
-        and inspect.isclass(getattr(mod,attr))
-    ]
-
-    for cls in test_classes:
-        class_name = f"{mod_name}.{cls}"
-        test_class = getattr(mod,cls)()
-        run_tests_in(class_name, test_class, results, tests_to_run, raise_on_err)
+    run_tests_in(
+        mod_name, mod, module_tests, results, tests_to_run, raise_on_err, capture
+    )
+
+    # Run test methods within test classes
+    for attr, cls, class_tests in test_classes:
+        class_name = f"{mod_name}.{attr}"
+        test_class = cls()
+        # tests set on the instance, eg in __init__, can't be cached with the class
+        instance_tests = [
+            name for name in getattr(test_class, '__dict__', ())
+            if name.startswith('test_')
+        ]
+        if instance_tests:
+            class_tests = tuple(sorted({*class_tests, *instance_tests}))
+        run_tests_in(
+            class_name, test_class, class_tests, results,
+            tests_to_run, raise_on_err, capture
+        )
 
     # All tests done. Print results
     results.print_test_summary()
 
 
-def run_tests_in(test_class_name, test_class, test_results, 
-                 tests_to_run, raise_on_err):
-    print(f"\nGathering tests for {test_class_name}:")
+@functools.lru_cache(maxsize=32)
+def _discover_tests(mod):
+    """Finds the test functions and test classes in a module.
+
+    Results are cached per module so repeated runs in the same session skip
+    discovery. Call `_discover_tests.cache_clear()` if tests are added to the
+    module afterwards.
+
+    Returns:
+        A tuple of the module's test function names, and a tuple of
+          (class name, class, test method names) for each test class.
+    """
+    # only the few matches are sorted, to run classes in dir() order
+    test_classes = sorted(
+        (attr, obj) for attr, obj in vars(mod).items()
+        if attr.startswith('Test') and isinstance(obj, type)
+    )
+    test_classes = tuple(
+        (attr, cls, get_test_names(cls)) for attr, cls in test_classes
+    )
+    return get_test_names(mod), test_classes
+
+
+def get_test_names(namespace):
+    """Returns the sorted names of the tests defined in a module or test class.
+
+    Reads the namespaces directly rather than calling dir(), which would also
+    list the ~25 attributes every class inherits from `object`.
+    """
+    if isinstance(namespace, types.ModuleType):
+        names = vars(namespace)
+    else:
+        names = set()
+        # the last class in the mro is object, which has no tests
+        for cls in namespace.__mro__[:-1]:
+            names.update(vars(cls))
+    return tuple(sorted(name for name in names if name.startswith('test_')))
+
+
+def run_tests_in(test_class_name, test_class, tests, test_results, 
+                 tests_to_run, raise_on_err, capture=True):
+    # bound to the console; sys.stdout is switched back before each write
+    write = sys.stdout.write
+    switch = switch_stdout
+    write(f"\nGathering tests for {test_class_name}:\n")
     
-    tests = [attr for attr in dir(test_class) if attr.startswith('test_')]
     if tests_to_run:
         tests = [test for test in tests if test in tests_to_run]
+    tests = [(test, getattr(test_class, test)) for test in tests]
     
     if tests:
-        max_text_len = max(map(len,tests))
+        max_text_len = max(len(test) for test, _ in tests)
+        dots_pool = '.' * max_text_len
+    # only worth writing the test name ahead of its result if someone's watching
+    show_running = sys.stdout.isatty()
 
-    for test in tests:
+    for test, test_func in tests:
         test_results.testcount += 1
-        print(f"  running {test}", end='')
-        switch_stdout()                        
+        running = f"  running {test}"
+        if show_running:
+            write(running)
+            # the line isn't finished, so a line-buffered terminal won't show it yet
+            sys.stdout.flush()
+            running = ''
+        if capture: switch()                        
         try:
-            getattr(test_class, test)()
+            test_func()
 
         except Exception as e:
-            captured_printout = switch_stdout(read_stream=True)
-            locals = get_local_variables()
-            failed_test = format_failed_test_printout(
-                test, e, captured_printout, locals
-            )
-            test_results.failed_tests.append(failed_test) 
+            captured_printout = (switch(read_stream=True)
+                                 if capture else None)
 
-            print(format_test_result(test, max_text_len, False))          
+            write(
+                f'{running}{format_test_result(test, max_text_len, dots_pool, False)}\n'
+            )
             test_results.failcount += 1
             # err = sys.exc_info()
             if raise_on_err: raise e
+            # formatted when the summary is printed
+            test_results.failed_tests.append(
+                (test, snapshot_failure(e), captured_printout)
+            ) 
 
         else:
-            switch_stdout(flush_stream=True)
-            print(format_test_result(test, max_text_len))    
+            if capture: switch(flush_stream=True)
+            write(
+                f'{running}{format_test_result(test, max_text_len, dots_pool)}\n'
+            )
 
 
 